@@ -4,12 +4,27 @@ Performs DAST (Dynamic Application Security Testing) and security checks on AI o
 """
 
 import re
+import copy
 import json
 import hashlib
+import functools
+import os
+import threading
+from collections import OrderedDict
 from typing import Dict, List, Optional, Tuple
 from dataclasses import dataclass
 from enum import Enum
 
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 class ViolationSeverity(Enum):
     LOW = "low"
@@ -34,16 +49,298 @@ class ComplianceResult:
     confidence: float = 1.0
 
 
+SEVERITY_PRIORITY = {
+    ViolationSeverity.LOW: 1,
+    ViolationSeverity.MEDIUM: 2,
+    ViolationSeverity.HIGH: 3,
+    ViolationSeverity.CRITICAL: 4
+}
+
+_MEDIUM_PRIORITY = SEVERITY_PRIORITY[ViolationSeverity.MEDIUM]
+_HIGH_PRIORITY = SEVERITY_PRIORITY[ViolationSeverity.HIGH]
+_CRITICAL_PRIORITY = SEVERITY_PRIORITY[ViolationSeverity.CRITICAL]
+
+_REGEX_FLAGS = {
+    "i": re.IGNORECASE,
+    "m": re.MULTILINE,
+    "s": re.DOTALL
+}
+
+JAILBREAK_KEYWORDS = [
+    "ignore previous instructions",
+    "forget your instructions",
+    "act as if",
+    "pretend to be",
+    "you are now",
+    "system override",
+    "developer mode",
+    "jailbreak"
+]
+
+# Regex features that break when a pattern is embedded in a combined
+# alternation (backreferences shift with the surrounding groups)
+_BACKREFERENCE = re.compile(r"\\\d|\(\?P=")
+
+# Indicators of step-by-step reasoning
+STEP_INDICATORS = [
+    "step 1", "step 2", "first", "second", "next", "then",
+    "let's break this down", "here's how", "we can solve this",
+    "to solve this", "the process", "reasoning"
+]
+
+
+def _build_automaton(entries: Dict[str, object]):
+    """
+    Build a multi-needle matcher from a needle -> payload mapping so a text is
+    scanned once for all needles. Uses an Aho-Corasick automaton when
+    pyahocorasick is installed and falls back to a plain tuple of pairs otherwise.
+    """
+    if ahocorasick is None or not entries:
+        return tuple(entries.items())
+    
+    automaton = ahocorasick.Automaton()
+    for needle, payload in entries.items():
+        automaton.add_word(needle, payload)
+    automaton.make_automaton()
+    return automaton
+
+
+def _build_matcher(keywords: List[str], lowercase: bool = False):
+    """Build a matcher whose payload is (position in keywords, original keyword)"""
+    entries = {}
+    for position, keyword in enumerate(keywords):
+        entries.setdefault(keyword.lower() if lowercase else keyword, (position, keyword))
+    return _build_automaton(entries)
+
+
+def _iter_matches(matcher, text: str):
+    """Yield the payload of every needle found in text"""
+    if isinstance(matcher, tuple):
+        for needle, payload in matcher:
+            if needle in text:
+                yield payload
+        return
+    
+    for _, payload in matcher.iter(text):
+        yield payload
+
+
+def _any_match(matcher, text: str) -> bool:
+    """Whether any needle occurs in text, stopping at the first hit"""
+    return next(_iter_matches(matcher, text), None) is not None
+
+
+def _first_match(matcher, text: str) -> Optional[Tuple[int, str]]:
+    """
+    Return (position, keyword) for the found keyword that comes first in the
+    keyword list, or None. The automaton reports hits in text order, so every
+    hit is visited; the tuple fallback is already in list order.
+    """
+    if isinstance(matcher, tuple):
+        return next(_iter_matches(matcher, text), None)
+    return min(_iter_matches(matcher, text), default=None)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_guardrails(guardrails_path: str, mtime: float) -> Dict:
+    """
+    Parse a guardrails file. Cached per (path, mtime) so repeated checkers
+    share one parse while edits to the file are still picked up; the returned
+    dict is shared and must be treated as read-only.
+    """
+    with open(guardrails_path, 'rb') as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Static indicator sets, built once at import and shared by every checker
+_JAILBREAK_AC = _build_matcher(JAILBREAK_KEYWORDS)
+_STEP_AC = _build_matcher(STEP_INDICATORS)
+
+
 class ComplianceChecker:
     """Main compliance checker that enforces Kairo guardrails"""
     
-    def __init__(self, guardrails_path: str = "kairo/guardrails.json"):
-        """Initialize the compliance checker with guardrails"""
-        with open(guardrails_path, 'r') as f:
-            self.guardrails = json.load(f)
-        self.rules = self.guardrails.get("rules", [])
+    def __init__(self, guardrails_path: str = "kairo/guardrails.json", cache_size: int = 4096):
+        """
+        Initialize the compliance checker with guardrails
+        
+        Args:
+            guardrails_path: Path to the guardrails JSON file
+            cache_size: Number of context-free results kept for replayed requests (0 disables)
+        """
+        self.guardrails = _load_guardrails(guardrails_path, os.path.getmtime(guardrails_path))
+        # Working copy of the rules; compiled state is attached here so the
+        # raw guardrails served by the MCP server stay JSON-serializable
+        self.rules = copy.deepcopy(self.guardrails.get("rules", []))
+        for position, rule in enumerate(self.rules):
+            rule["_priority"] = self._severity_priority(ViolationSeverity(rule["severity"]))
+            rule["_position"] = position
+        # Most severe rules first: fail-fast checks stop as early as possible and
+        # the first violation in rule order always carries the message
+        self.rules.sort(key=lambda rule: rule["_priority"], reverse=True)
+        self._build_rule_columns()
+        self._compile_rules()
+        
+        self._cache_size = cache_size
+        self._result_cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def _build_rule_columns(self):
+        """
+        Store per-rule outcome data as parallel lists indexed by rule position,
+        so a request only touches the rules that actually fired
+        """
+        self._rule_actions = []
+        self._rule_stops = []
+        self._rule_messages = []
+        # Position in the guardrails file, used to report violations in file order
+        self._rule_positions = []
+        
+        for rule in self.rules:
+            priority = rule["_priority"]
+            block = rule.get("action") == "block"
+            if priority >= _HIGH_PRIORITY and block:
+                rule_action = Action.BLOCK
+            elif priority == _MEDIUM_PRIORITY and rule.get("action") == "warn":
+                rule_action = Action.WARN
+            else:
+                rule_action = None
+            
+            self._rule_actions.append(rule_action)
+            self._rule_stops.append(priority == _CRITICAL_PRIORITY and block)
+            self._rule_messages.append(rule.get("message", "Compliance violation detected"))
+            self._rule_positions.append(rule["_position"])
+    
+    def _compile_rules(self):
+        """Precompile rule checks once so the per-request path stays cheap"""
+        regex_checks_by_severity = {}
+        keyword_entries = {True: {}, False: {}}
+        self._residual_indices = []
+        self._cross_boundary = False
+        
+        for index, rule in enumerate(self.rules):
+            checks = rule.get("checks", [])
+            if rule.get("check"):
+                checks = [rule["check"]] + checks
+            
+            for check in checks:
+                if check.get("type") == "regex":
+                    regex_flags = 0
+                    for flag in check.get("flags", ""):
+                        regex_flags |= _REGEX_FLAGS.get(flag, 0)
+                    check["_compiled"] = re.compile(check["pattern"], regex_flags)
+                elif check.get("type") == "keyword":
+                    check["_matcher"] = _build_matcher(
+                        check.get("keywords", []),
+                        lowercase=not check.get("case_sensitive", True)
+                    )
+                    # Opt-in: also match keywords spanning the input/output boundary
+                    check["_cross_boundary"] = rule.get("cross_boundary", False)
+                    self._cross_boundary |= check["_cross_boundary"]
+            
+            # Rules made of a single regex or keyword check are evaluated together
+            if len(checks) == 1 and self._is_combinable(checks[0]):
+                regex_checks_by_severity.setdefault(rule["severity"], []).append((index, checks[0]))
+            elif len(checks) == 1 and checks[0].get("type") == "keyword" and not checks[0]["_cross_boundary"]:
+                case_sensitive = checks[0].get("case_sensitive", True)
+                for position, keyword in enumerate(checks[0].get("keywords", [])):
+                    needle = keyword if case_sensitive else keyword.lower()
+                    keyword_entries[case_sensitive].setdefault(needle, []).append((index, position, keyword))
+            else:
+                self._residual_indices.append(index)
+        
+        self._combine_regex_checks(regex_checks_by_severity)
+        # One automaton per case mode, with payloads of (rule index, keyword position, keyword)
+        self._keyword_matcher = _build_automaton(keyword_entries[True])
+        self._keyword_matcher_lower = _build_automaton(keyword_entries[False])
+    
+    def _is_combinable(self, check: Dict) -> bool:
+        """Whether a regex check can be embedded in a combined alternation"""
+        if check.get("type") != "regex":
+            return False
+        if check["_compiled"].groupindex or _BACKREFERENCE.search(check["pattern"]):
+            return False
+        if not set(check.get("flags", "")) <= set(_REGEX_FLAGS):
+            return False
+        try:
+            re.compile(self._scoped_pattern(check))
+        except re.error:
+            # e.g. global inline flags, which are only valid at the start of a pattern
+            return False
+        return True
+    
+    def _scoped_pattern(self, check: Dict) -> str:
+        """Wrap a regex check's pattern so its flags only apply to itself"""
+        return f"(?{check.get('flags', '')}:{check['pattern']})"
+    
+    def _combine_regex_checks(self, regex_checks_by_severity: Dict[str, List[Tuple[int, Dict]]]):
+        """Build one alternation pattern per severity class"""
+        self._combined_regex = {}
+        self._regex_group_to_rule = {}
+        self._regex_groups = {}
+        
+        for severity, rule_checks in regex_checks_by_severity.items():
+            alternatives = []
+            groups = []
+            for index, check in rule_checks:
+                group = f"r{index}"
+                self._regex_group_to_rule[group] = (index, check)
+                alternatives.append(f"(?P<{group}>{self._scoped_pattern(check)})")
+                groups.append(group)
+            
+            self._combined_regex[severity] = re.compile("|".join(alternatives))
+            self._regex_groups[severity] = groups
     
-    def check_compliance(self, user_input: str, ai_output: str, context: Optional[Dict] = None) -> ComplianceResult:
+    def _scan_regex_rules(self, ai_output: str) -> Dict[int, str]:
+        """
+        Evaluate all combined regex rules, scanning the output once per severity class.
+        Returns violation details keyed by rule index.
+        
+        finditer only reports one alternative per position and never overlapping
+        matches, so when a class matched at all the rules it did not report are
+        confirmed with their own compiled pattern.
+        """
+        hits = {}
+        for severity, combined in self._combined_regex.items():
+            matched = {m.lastgroup for m in combined.finditer(ai_output)}
+            if not matched:
+                continue
+            
+            for group in self._regex_groups[severity]:
+                index, check = self._regex_group_to_rule[group]
+                if group in matched or check["_compiled"].search(ai_output):
+                    hits[index] = f"Pattern matched: {check['pattern']}"
+        return hits
+    
+    def _scan_keyword_rules(self, texts: Dict[str, str]) -> Dict[int, str]:
+        """
+        Evaluate all combined keyword rules with one automaton pass per case mode
+        over each text. Returns violation details keyed by rule index, naming the
+        first keyword in the rule's list that was found.
+        """
+        found = {}
+        for matcher, text in (
+            (self._keyword_matcher, texts["user_input"]),
+            (self._keyword_matcher, texts["ai_output"]),
+            (self._keyword_matcher_lower, texts["user_input_lower"]),
+            (self._keyword_matcher_lower, texts["ai_output_lower"])
+        ):
+            for entries in _iter_matches(matcher, text):
+                for index, position, keyword in entries:
+                    if index not in found or position < found[index][0]:
+                        found[index] = (position, keyword)
+        return {index: f"Keyword detected: {keyword}" for index, (_, keyword) in found.items()}
+    
+    def check_compliance(
+        self,
+        user_input: str,
+        ai_output: str,
+        context: Optional[Dict] = None,
+        fail_fast: bool = False
+    ) -> ComplianceResult:
         """
         Check if the AI output complies with all guardrails
         
@@ -51,52 +348,104 @@ class ComplianceChecker:
             user_input: The user's input/prompt
             ai_output: The AI's response
             context: Optional context (session info, etc.)
+            fail_fast: Stop at the first critical blocking violation instead of
+                collecting all of them (action and message are unaffected)
         
         Returns:
             ComplianceResult with compliance status and violations
         """
-        violations = []
-        highest_severity = None
-        action = Action.ALLOW
+        # Results only depend on the texts when no context is given,
+        # so retried requests can be replayed from the cache
+        if context is not None or not self._cache_size:
+            return self._evaluate(user_input, ai_output, context, fail_fast)
         
-        # Check each rule
-        for rule in self.rules:
-            rule_result = self._check_rule(rule, user_input, ai_output, context)
-            
+        key = (fail_fast, self._cache_key(user_input, ai_output))
+        with self._cache_lock:
+            cached = self._result_cache.get(key)
+            if cached is not None:
+                self._result_cache.move_to_end(key)
+        
+        if cached is None:
+            result = self._evaluate(user_input, ai_output, context, fail_fast)
+            cached = (result.is_compliant, tuple(result.violations), result.action, result.message, result.confidence)
+            with self._cache_lock:
+                self._result_cache[key] = cached
+                if len(self._result_cache) > self._cache_size:
+                    self._result_cache.popitem(last=False)
+        
+        is_compliant, violations, action, message, confidence = cached
+        return ComplianceResult(
+            is_compliant=is_compliant,
+            violations=[dict(v) for v in violations],
+            action=action,
+            message=message,
+            confidence=confidence
+        )
+    
+    def _cache_key(self, user_input: str, ai_output: str) -> bytes:
+        """Hash both texts into a compact result cache key"""
+        user_bytes = user_input.encode("utf-8")
+        digest = hashlib.blake2b(digest_size=16)
+        # Length prefix keeps ("a", "bc") and ("ab", "c") apart
+        digest.update(len(user_bytes).to_bytes(8, "little"))
+        digest.update(user_bytes)
+        digest.update(ai_output.encode("utf-8"))
+        return digest.digest()
+    
+    def _evaluate(
+        self,
+        user_input: str,
+        ai_output: str,
+        context: Optional[Dict],
+        fail_fast: bool = False
+    ) -> ComplianceResult:
+        """Run the rules against the input and output"""
+        # Shared across all rules so each text is lowercased once
+        texts = self._prepare_texts(user_input, ai_output, self._cross_boundary)
+        
+        # Violation details keyed by rule index
+        hits = self._scan_regex_rules(ai_output)
+        hits.update(self._scan_keyword_rules(texts))
+        
+        # Rules are sorted by severity, so nothing after the first critical
+        # blocking violation can change the outcome
+        stop_at = len(self.rules)
+        if fail_fast:
+            stop_at = min((index for index in hits if self._rule_stops[index]), default=stop_at)
+        
+        # Check the remaining rules one by one
+        for index in self._residual_indices:
+            if index > stop_at:
+                break
+            rule_result = self._check_rule(self.rules[index], user_input, ai_output, context, texts)
             if not rule_result["compliant"]:
-                violations.append({
-                    "rule_id": rule["id"],
-                    "rule_name": rule["name"],
-                    "severity": rule["severity"],
-                    "description": rule["description"],
-                    "details": rule_result.get("details", "")
-                })
-                
-                # Determine action based on severity
-                severity = ViolationSeverity(rule["severity"])
-                if severity == ViolationSeverity.CRITICAL or severity == ViolationSeverity.HIGH:
-                    if rule.get("action") == "block":
-                        action = Action.BLOCK
-                elif severity == ViolationSeverity.MEDIUM:
-                    if action != Action.BLOCK and rule.get("action") == "warn":
-                        action = Action.WARN
-                
-                # Track highest severity
-                if highest_severity is None or self._severity_priority(severity) > self._severity_priority(highest_severity):
-                    highest_severity = severity
-        
-        # Get message from highest priority violation
-        message = None
-        if violations:
-            highest_priority_violation = max(
-                violations,
-                key=lambda v: self._severity_priority(ViolationSeverity(v["severity"]))
-            )
-            # Find the rule to get its message
-            for rule in self.rules:
-                if rule["id"] == highest_priority_violation["rule_id"]:
-                    message = rule.get("message", "Compliance violation detected")
-                    break
+                hits[index] = rule_result.get("details", "")
+                if fail_fast and self._rule_stops[index]:
+                    stop_at = index
+        
+        fired = sorted(index for index in hits if index <= stop_at)
+        violations = []
+        for index in sorted(fired, key=self._rule_positions.__getitem__):
+            rule = self.rules[index]
+            violations.append({
+                "rule_id": rule["id"],
+                "rule_name": rule["name"],
+                "severity": rule["severity"],
+                "description": rule["description"],
+                "details": hits[index]
+            })
+        
+        # Determine action based on severity
+        actions = {self._rule_actions[index] for index in fired}
+        if Action.BLOCK in actions:
+            action = Action.BLOCK
+        elif Action.WARN in actions:
+            action = Action.WARN
+        else:
+            action = Action.ALLOW
+        
+        # The first fired rule has the highest severity
+        message = self._rule_messages[fired[0]] if fired else None
         
         return ComplianceResult(
             is_compliant=len(violations) == 0,
@@ -105,51 +454,78 @@ class ComplianceChecker:
             message=message
         )
     
-    def _check_rule(self, rule: Dict, user_input: str, ai_output: str, context: Optional[Dict]) -> Dict:
+    def _prepare_texts(self, user_input: str, ai_output: str, cross_boundary: bool = True) -> Dict[str, str]:
+        """
+        Precompute the text variants scanned by keyword checks. The two texts are
+        scanned separately; the concatenation is only built when a cross-boundary
+        rule needs it.
+        """
+        texts = {
+            "user_input": user_input,
+            "ai_output": ai_output,
+            "user_input_lower": user_input.lower(),
+            "ai_output_lower": ai_output.lower()
+        }
+        if cross_boundary:
+            texts["combined"] = user_input + " " + ai_output
+            texts["combined_lower"] = texts["user_input_lower"] + " " + texts["ai_output_lower"]
+        return texts
+    
+    def _check_rule(
+        self,
+        rule: Dict,
+        user_input: str,
+        ai_output: str,
+        context: Optional[Dict],
+        texts: Optional[Dict[str, str]] = None
+    ) -> Dict:
         """Check a single rule against the input and output"""
         check_config = rule.get("check", {})
         checks = rule.get("checks", [])
         
         # Handle single check
         if check_config:
-            return self._execute_check(check_config, user_input, ai_output, context)
+            return self._execute_check(check_config, user_input, ai_output, context, texts)
         
         # Handle multiple checks (all must pass)
         if checks:
             for check in checks:
-                result = self._execute_check(check, user_input, ai_output, context)
+                result = self._execute_check(check, user_input, ai_output, context, texts)
                 if not result["compliant"]:
                     return result
             return {"compliant": True}
         
         return {"compliant": True}
     
-    def _execute_check(self, check: Dict, user_input: str, ai_output: str, context: Optional[Dict]) -> Dict:
+    def _execute_check(
+        self,
+        check: Dict,
+        user_input: str,
+        ai_output: str,
+        context: Optional[Dict],
+        texts: Optional[Dict[str, str]] = None
+    ) -> Dict:
         """Execute a specific check type"""
         check_type = check.get("type")
+        if texts is None:
+            texts = self._prepare_texts(user_input, ai_output)
         
         if check_type == "regex":
-            pattern = check.get("pattern")
-            flags = check.get("flags", "")
-            regex_flags = 0
-            if "i" in flags:
-                regex_flags |= re.IGNORECASE
-            
-            if re.search(pattern, ai_output, regex_flags):
-                return {"compliant": False, "details": f"Pattern matched: {pattern}"}
+            if check["_compiled"].search(ai_output):
+                return {"compliant": False, "details": f"Pattern matched: {check['pattern']}"}
         
         elif check_type == "keyword":
-            keywords = check.get("keywords", [])
-            case_sensitive = check.get("case_sensitive", True)
-            text_to_check = user_input + " " + ai_output
+            suffix = "" if check.get("case_sensitive", True) else "_lower"
+            if check.get("_cross_boundary"):
+                sources = ("combined",)
+            else:
+                sources = ("user_input", "ai_output")
             
-            for keyword in keywords:
-                if case_sensitive:
-                    if keyword in text_to_check:
-                        return {"compliant": False, "details": f"Keyword detected: {keyword}"}
-                else:
-                    if keyword.lower() in text_to_check.lower():
-                        return {"compliant": False, "details": f"Keyword detected: {keyword}"}
+            matches = [_first_match(check["_matcher"], texts[source + suffix]) for source in sources]
+            matches = [match for match in matches if match is not None]
+            if matches:
+                _, keyword = min(matches)
+                return {"compliant": False, "details": f"Keyword detected: {keyword}"}
         
         elif check_type == "length":
             min_length = check.get("min_length", 0)
@@ -172,41 +548,15 @@ class ComplianceChecker:
     
     def _severity_priority(self, severity: ViolationSeverity) -> int:
         """Get numeric priority for severity (higher = more severe)"""
-        priorities = {
-            ViolationSeverity.LOW: 1,
-            ViolationSeverity.MEDIUM: 2,
-            ViolationSeverity.HIGH: 3,
-            ViolationSeverity.CRITICAL: 4
-        }
-        return priorities.get(severity, 0)
+        return SEVERITY_PRIORITY.get(severity, 0)
     
     def check_jailbreak_attempt(self, user_input: str) -> bool:
         """Quick check for jailbreak attempts in user input"""
-        jailbreak_keywords = [
-            "ignore previous instructions",
-            "forget your instructions",
-            "act as if",
-            "pretend to be",
-            "you are now",
-            "system override",
-            "developer mode",
-            "jailbreak"
-        ]
-        
-        user_input_lower = user_input.lower()
-        return any(keyword in user_input_lower for keyword in jailbreak_keywords)
+        return _any_match(_JAILBREAK_AC, user_input.lower())
     
     def requires_step_by_step(self, ai_output: str) -> bool:
         """Check if output includes step-by-step reasoning"""
-        # Look for indicators of step-by-step reasoning
-        step_indicators = [
-            "step 1", "step 2", "first", "second", "next", "then",
-            "let's break this down", "here's how", "we can solve this",
-            "to solve this", "the process", "reasoning"
-        ]
-        
-        output_lower = ai_output.lower()
-        return any(indicator in output_lower for indicator in step_indicators)
+        return _any_match(_STEP_AC, ai_output.lower())
 
 
 # Example usage
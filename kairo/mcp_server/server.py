@@ -6,6 +6,8 @@ Model Context Protocol server for educational tools and guardrails
 import asyncio
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from typing import Any, Dict, List, Optional
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
@@ -13,11 +15,21 @@ from pydantic import BaseModel
 import sys
 
 # Add parent directory to path to import compliance_check
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+KAIRO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(KAIRO_DIR)
 from compliance_check import ComplianceChecker, ComplianceResult
 
 
-app = FastAPI(title="Kairo MCP Server", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Size the default thread pool used to offload CPU-bound compliance checks"""
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count())
+    asyncio.get_running_loop().set_default_executor(executor)
+    yield
+    executor.shutdown(wait=False)
+
+
+app = FastAPI(title="Kairo MCP Server", version="1.0.0", lifespan=lifespan)
 
 # CORS middleware
 app.add_middleware(
@@ -28,8 +40,8 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Initialize compliance checker
-compliance_checker = ComplianceChecker()
+# Initialize compliance checker (path resolved from this file so the server starts from any directory)
+compliance_checker = ComplianceChecker(os.path.join(KAIRO_DIR, "guardrails.json"))
 
 
 class CheckRequest(BaseModel):
@@ -77,9 +89,11 @@ async def check_compliance(request: CheckRequest):
     
     This is the main endpoint for compliance checking.
     It validates both user input and AI output against all configured rules.
+    The check is CPU-bound, so it runs in a worker thread to keep the event loop free.
     """
     try:
-        result: ComplianceResult = compliance_checker.check_compliance(
+        result: ComplianceResult = await asyncio.to_thread(
+            compliance_checker.check_compliance,
             user_input=request.user_input,
             ai_output=request.ai_output,
             context=request.context
@@ -138,7 +152,7 @@ async def get_guardrail_rule(rule_id: str):
     """
     Get a specific guardrail rule by ID
     """
-    for rule in compliance_checker.rules:
+    for rule in compliance_checker.guardrails.get("rules", []):
         if rule["id"] == rule_id:
             return rule
     
@@ -5,15 +5,37 @@ Handles routing, scaling, and test-time scaling for educational AI
 """
 
 import asyncio
+import functools
 import os
+import time
 import yaml
 import httpx
 import json
-from typing import Dict, List, Optional, AsyncGenerator, Any
+from typing import Dict, List, Optional, AsyncGenerator, Any, Tuple
 from enum import Enum
 from dataclasses import dataclass
 from datetime import datetime
-import hashlib
+
+try:
+    import ahocorasick
+except ImportError:
+    ahocorasick = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import h2  # noqa: F401 - enables HTTP/2 in httpx (httpx[http2])
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+try:
+    from yaml import CSafeLoader as _YamlLoader
+except ImportError:
+    from yaml import SafeLoader as _YamlLoader
 
 
 class DifficultyLevel(Enum):
@@ -24,6 +46,122 @@ class DifficultyLevel(Enum):
     EXPERT = "expert"
 
 
+# Difficulty tiers in ascending order; a prompt gets the highest tier it has a keyword for
+DIFFICULTY_TIERS = [
+    DifficultyLevel.EASY,
+    DifficultyLevel.MEDIUM,
+    DifficultyLevel.HARD,
+    DifficultyLevel.EXPERT
+]
+
+# Simple heuristics for difficulty
+DIFFICULTY_KEYWORDS = {
+    DifficultyLevel.EXPERT: ["prove", "derive", "theorem", "advanced", "complex"],
+    DifficultyLevel.HARD: ["solve", "calculate", "explain", "why", "how"],
+    DifficultyLevel.MEDIUM: ["what", "define", "describe"]
+}
+
+
+def _build_difficulty_matcher():
+    """
+    Build a matcher mapping each difficulty keyword to its tier index.
+    Uses a single Aho-Corasick automaton when pyahocorasick is installed and
+    falls back to a tuple of (keyword, tier) pairs, highest tier first.
+    """
+    keyword_tiers = {}
+    for difficulty, keywords in DIFFICULTY_KEYWORDS.items():
+        tier = DIFFICULTY_TIERS.index(difficulty)
+        for keyword in keywords:
+            keyword_tiers[keyword] = max(tier, keyword_tiers.get(keyword, 0))
+    
+    if ahocorasick is None:
+        return tuple(sorted(keyword_tiers.items(), key=lambda item: item[1], reverse=True))
+    
+    automaton = ahocorasick.Automaton()
+    for keyword, tier in keyword_tiers.items():
+        automaton.add_word(keyword, tier)
+    automaton.make_automaton()
+    return automaton
+
+
+# Static difficulty keywords, built once at import and shared by every worker
+_DIFFICULTY_AC = _build_difficulty_matcher()
+
+
+# Sent with every pre-serialized body; content= does not set it the way json= did
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+def _dumps(payload: Any) -> bytes:
+    """Serialize a request payload to JSON bytes, using orjson when available"""
+    if orjson is not None:
+        # OPT_NON_STR_KEYS matches json.dumps for non-string context keys
+        return orjson.dumps(payload, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(payload).encode("utf-8")
+
+
+def _loads(data: Any) -> Any:
+    """Parse a JSON response body or stream line, using orjson when available"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+# Pooled clients shared by all workers, per event loop and then per (endpoint, api_key).
+# Pooled connections belong to the loop that opened them, so every loop gets its own
+# clients. Open connections keep their loop alive, so entries for loops that have
+# since closed are dropped whenever a new loop asks for its first client.
+_SHARED_CLIENTS: Dict[asyncio.AbstractEventLoop, Dict[Tuple[str, str], httpx.AsyncClient]] = {}
+
+
+def _get_shared_client(endpoint: str, api_key: str) -> httpx.AsyncClient:
+    """
+    Get the pooled HTTP client for an endpoint on the running event loop,
+    creating it on first use. Workers in the same process reuse its keep-alive
+    connections, multiplexed over HTTP/2 when the h2 package is installed.
+    """
+    loop = asyncio.get_running_loop()
+    clients = _SHARED_CLIENTS.get(loop)
+    if clients is None:
+        # Clients of a closed loop can no longer be closed cleanly; let them go
+        for stale in [stale for stale in _SHARED_CLIENTS if stale.is_closed()]:
+            del _SHARED_CLIENTS[stale]
+        clients = _SHARED_CLIENTS[loop] = {}
+    key = (endpoint, api_key)
+    client = clients.get(key)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=endpoint,
+            headers={
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json"
+            },
+            http2=_HTTP2_AVAILABLE,
+            limits=httpx.Limits(max_keepalive_connections=64, max_connections=128),
+            timeout=httpx.Timeout(120.0, connect=5.0)
+        )
+        clients[key] = client
+    return client
+
+
+async def aclose_shared_clients():
+    """Close the shared HTTP clients of the running event loop (call on shutdown)"""
+    clients = _SHARED_CLIENTS.pop(asyncio.get_running_loop(), {})
+    for client in clients.values():
+        await client.aclose()
+
+
+@functools.lru_cache(maxsize=4)
+def _load_yaml_config(config_path: str, mtime: float) -> Dict:
+    """
+    Parse a YAML config file. Cached per (path, mtime) so repeated workers
+    share one parse while edits to the file are still picked up; the returned
+    dict is shared and must be treated as read-only.
+    """
+    with open(config_path, 'r') as f:
+        return yaml.load(f, Loader=_YamlLoader)
+
+
 @dataclass
 class InferenceRequest:
     """Request for inference"""
@@ -58,23 +196,32 @@ class OvershootInferenceWorker:
         self.api_key = os.getenv("OVERSHOOT_API_KEY")
         self.endpoint = os.getenv("OVERSHOOT_ENDPOINT", "https://api.overshoot.ai")
         self.model = os.getenv("OVERSHOOT_MODEL", self.config["inference"]["model"]["default"])
+        self._params_by_difficulty = {
+            difficulty: self._get_inference_params(difficulty) for difficulty in DifficultyLevel
+        }
         
         if not self.api_key:
             raise ValueError("OVERSHOOT_API_KEY environment variable is required")
         
-        self.client = httpx.AsyncClient(
-            base_url=self.endpoint,
-            headers={
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json"
-            },
-            timeout=120.0
-        )
+        self._client = None
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """
+        HTTP client: an explicitly assigned client if any, otherwise the
+        shared client for the running event loop
+        """
+        if self._client is not None:
+            return self._client
+        return _get_shared_client(self.endpoint, self.api_key)
+    
+    @client.setter
+    def client(self, client: httpx.AsyncClient):
+        self._client = client
     
     def _load_config(self, config_path: str) -> Dict:
         """Load scaling configuration from YAML"""
-        with open(config_path, 'r') as f:
-            return yaml.safe_load(f)
+        return _load_yaml_config(config_path, os.path.getmtime(config_path))
     
     def _determine_difficulty(self, prompt: str, context: Optional[Dict] = None) -> DifficultyLevel:
         """
@@ -82,20 +229,20 @@ class OvershootInferenceWorker:
         In production, this could use ML models or heuristics
         """
         prompt_lower = prompt.lower()
+        top_tier = len(DIFFICULTY_TIERS) - 1
         
-        # Simple heuristics for difficulty
-        expert_keywords = ["prove", "derive", "theorem", "advanced", "complex"]
-        hard_keywords = ["solve", "calculate", "explain", "why", "how"]
-        medium_keywords = ["what", "define", "describe"]
+        if isinstance(_DIFFICULTY_AC, tuple):
+            tier = next((tier for keyword, tier in _DIFFICULTY_AC if keyword in prompt_lower), 0)
+            return DIFFICULTY_TIERS[tier]
         
-        if any(keyword in prompt_lower for keyword in expert_keywords):
-            return DifficultyLevel.EXPERT
-        elif any(keyword in prompt_lower for keyword in hard_keywords):
-            return DifficultyLevel.HARD
-        elif any(keyword in prompt_lower for keyword in medium_keywords):
-            return DifficultyLevel.MEDIUM
-        else:
-            return DifficultyLevel.EASY
+        # Single pass over the prompt, keeping the highest tier seen
+        best_tier = 0
+        for _, tier in _DIFFICULTY_AC.iter(prompt_lower):
+            if tier > best_tier:
+                best_tier = tier
+                if best_tier == top_tier:
+                    break
+        return DIFFICULTY_TIERS[best_tier]
     
     def _get_inference_params(self, difficulty: DifficultyLevel) -> Dict[str, Any]:
         """Get inference parameters based on difficulty level"""
@@ -105,7 +252,8 @@ class OvershootInferenceWorker:
             "temperature": difficulty_config["temperature"],
             "max_tokens": difficulty_config["max_tokens"],
             "num_passes": difficulty_config["num_passes"],
-            "timeout": difficulty_config["timeout"]
+            "timeout": difficulty_config["timeout"],
+            "timeout_seconds": float(str(difficulty_config["timeout"]).rstrip("s"))
         }
     
     async def infer(
@@ -127,8 +275,8 @@ class OvershootInferenceWorker:
         if request.difficulty is None:
             request.difficulty = self._determine_difficulty(request.prompt, request.context)
         
-        # Get inference parameters based on difficulty
-        params = self._get_inference_params(request.difficulty)
+        # Get inference parameters based on difficulty (copied, overrides below mutate it)
+        params = dict(self._params_by_difficulty[request.difficulty])
         
         # Override with request-specific params if provided
         if request.temperature is not None:
@@ -149,7 +297,7 @@ class OvershootInferenceWorker:
             "user_id": request.user_id
         }
         
-        start_time = datetime.now()
+        start_ns = time.perf_counter_ns()
         
         # Retry logic
         last_error = None
@@ -157,14 +305,15 @@ class OvershootInferenceWorker:
             try:
                 response = await self.client.post(
                     "/v1/inference",
-                    json=payload,
-                    timeout=float(params["timeout"].replace("s", ""))
+                    content=_dumps(payload),
+                    headers=_JSON_HEADERS,
+                    timeout=params["timeout_seconds"]
                 )
                 response.raise_for_status()
                 
-                data = response.json()
+                data = _loads(response.content)
                 
-                latency = (datetime.now() - start_time).total_seconds() * 1000
+                latency = (time.perf_counter_ns() - start_ns) / 1e6
                 
                 return InferenceResponse(
                     text=data["text"],
@@ -204,7 +353,7 @@ class OvershootInferenceWorker:
         if request.difficulty is None:
             request.difficulty = self._determine_difficulty(request.prompt, request.context)
         
-        params = self._get_inference_params(request.difficulty)
+        params = self._params_by_difficulty[request.difficulty]
         
         payload = {
             "model": self.model,
@@ -222,22 +371,36 @@ class OvershootInferenceWorker:
             async with self.client.stream(
                 "POST",
                 "/v1/inference/stream",
-                json=payload,
-                timeout=float(params["timeout"].replace("s", ""))
+                content=_dumps(payload),
+                headers=_JSON_HEADERS,
+                timeout=params["timeout_seconds"]
             ) as response:
                 response.raise_for_status()
                 
                 async for line in response.aiter_lines():
-                    if line:
-                        try:
-                            data = json.loads(line)
-                            if "token" in data:
-                                yield data["token"]
-                            elif "error" in data:
-                                raise Exception(f"Stream error: {data['error']}")
-                        except json.JSONDecodeError:
-                            # Skip non-JSON lines
-                            continue
+                    # Accept SSE framing ("data: {...}") as well as bare JSON lines
+                    line = line.lstrip()
+                    if line.startswith("data:"):
+                        line = line[5:].lstrip()
+                    
+                    # Skip blank lines and keepalives without paying for a parse
+                    if not line or line[0] != "{":
+                        continue
+                    
+                    try:
+                        data = _loads(line)
+                    except json.JSONDecodeError:
+                        # Skip malformed lines
+                        continue
+                    
+                    token = data.get("token")
+                    if token is not None:
+                        yield token
+                        continue
+                    
+                    error = data.get("error")
+                    if error is not None:
+                        raise Exception(f"Stream error: {error}")
         
         except httpx.HTTPError as e:
             raise Exception(f"Stream inference failed: {e}")
@@ -249,6 +412,9 @@ class OvershootInferenceWorker:
         """
         Perform batch inference for multiple requests
         
+        Sub-batches are sent concurrently (bounded by batching.max_concurrency);
+        responses are returned in the same order as the sub-batches.
+        
         Args:
             requests: List of inference requests
         
@@ -266,11 +432,14 @@ class OvershootInferenceWorker:
                 grouped_requests[difficulty] = []
             grouped_requests[difficulty].append(req)
         
-        # Process each group
-        all_responses = []
+        batching_config = self.config["inference"]["batching"]
+        batch_size = batching_config["batch_size"]
+        semaphore = asyncio.Semaphore(batching_config.get("max_concurrency", 8))
+        
+        # Build every sub-batch up front
+        batches = []
         for difficulty, req_group in grouped_requests.items():
-            # Process in batches according to config
-            batch_size = self.config["inference"]["batching"]["batch_size"]
+            params = self._params_by_difficulty[req_group[0].difficulty]
             
             for i in range(0, len(req_group), batch_size):
                 batch = req_group[i:i + batch_size]
@@ -281,8 +450,8 @@ class OvershootInferenceWorker:
                     "requests": [
                         {
                             "prompt": req.prompt,
-                            "temperature": self._get_inference_params(req.difficulty)["temperature"],
-                            "max_tokens": self._get_inference_params(req.difficulty)["max_tokens"],
+                            "temperature": params["temperature"],
+                            "max_tokens": params["max_tokens"],
                             "context": req.context or {},
                             "session_id": req.session_id,
                             "user_id": req.user_id
@@ -290,59 +459,91 @@ class OvershootInferenceWorker:
                         for req in batch
                     ]
                 }
-                
-                try:
-                    response = await self.client.post(
-                        "/v1/inference/batch",
-                        json=batch_payload,
-                        timeout=60.0
-                    )
-                    response.raise_for_status()
-                    
-                    data = response.json()
-                    for j, result in enumerate(data["results"]):
-                        all_responses.append(InferenceResponse(
-                            text=result["text"],
-                            model=result.get("model", self.model),
-                            cluster_id=result.get("cluster_id", "unknown"),
-                            latency_ms=result.get("latency_ms", 0),
-                            tokens_generated=result.get("tokens_generated", 0),
-                            difficulty_used=batch[j].difficulty,
-                            timestamp=datetime.now()
-                        ))
-                
-                except httpx.HTTPError as e:
-                    # Fallback to individual requests if batch fails
-                    for req in batch:
-                        try:
-                            resp = await self.infer(req)
-                            all_responses.append(resp)
-                        except Exception as e2:
-                            # Create error response
-                            all_responses.append(InferenceResponse(
-                                text=f"Error: {str(e2)}",
-                                model=self.model,
-                                cluster_id="error",
-                                latency_ms=0,
-                                tokens_generated=0,
-                                difficulty_used=req.difficulty,
-                                timestamp=datetime.now()
-                            ))
+                batches.append((batch, batch_payload))
+        
+        batch_results = await asyncio.gather(
+            *(self._post_batch(payload, semaphore) for _, payload in batches),
+            return_exceptions=True
+        )
+        
+        # Fallback to individual requests for every batch that failed
+        failed_requests = []
+        for (batch, _), result in zip(batches, batch_results):
+            if isinstance(result, httpx.HTTPError):
+                failed_requests.extend(batch)
+            elif isinstance(result, BaseException):
+                raise result
+        
+        fallback_responses = iter(await asyncio.gather(
+            *(self._infer_or_error(req, semaphore) for req in failed_requests)
+        ))
+        
+        all_responses = []
+        for (batch, _), result in zip(batches, batch_results):
+            if isinstance(result, httpx.HTTPError):
+                all_responses.extend(next(fallback_responses) for _ in batch)
+                continue
+            
+            now = datetime.now()
+            for j, item in enumerate(result["results"]):
+                all_responses.append(InferenceResponse(
+                    text=item["text"],
+                    model=item.get("model", self.model),
+                    cluster_id=item.get("cluster_id", "unknown"),
+                    latency_ms=item.get("latency_ms", 0),
+                    tokens_generated=item.get("tokens_generated", 0),
+                    difficulty_used=batch[j].difficulty,
+                    timestamp=now
+                ))
         
         return all_responses
     
+    async def _post_batch(self, batch_payload: Dict[str, Any], semaphore: asyncio.Semaphore) -> Dict[str, Any]:
+        """Send one sub-batch to the batch inference endpoint"""
+        async with semaphore:
+            response = await self.client.post(
+                "/v1/inference/batch",
+                content=_dumps(batch_payload),
+                headers=_JSON_HEADERS,
+                timeout=60.0
+            )
+            response.raise_for_status()
+            return _loads(response.content)
+    
+    async def _infer_or_error(self, request: InferenceRequest, semaphore: asyncio.Semaphore) -> InferenceResponse:
+        """Run a single fallback inference, turning failures into an error response"""
+        try:
+            async with semaphore:
+                return await self.infer(request)
+        except Exception as e:
+            # Create error response
+            return InferenceResponse(
+                text=f"Error: {str(e)}",
+                model=self.model,
+                cluster_id="error",
+                latency_ms=0,
+                tokens_generated=0,
+                difficulty_used=request.difficulty,
+                timestamp=datetime.now()
+            )
+    
     async def get_cluster_status(self) -> Dict[str, Any]:
         """Get status of all clusters"""
         try:
             response = await self.client.get("/v1/clusters/status")
             response.raise_for_status()
-            return response.json()
+            return _loads(response.content)
         except httpx.HTTPError as e:
             return {"error": str(e), "clusters": []}
     
     async def close(self):
-        """Close the HTTP client"""
-        await self.client.aclose()
+        """
+        Close the HTTP client if one was assigned to this worker. Shared clients
+        are left open for other workers; use aclose_shared_clients() on shutdown.
+        """
+        if self._client is not None:
+            client, self._client = self._client, None
+            await client.aclose()
 
 
 # Example usage
@@ -367,6 +568,7 @@ async def main():
         print(f"Error: {e}")
     finally:
         await worker.close()
+        await aclose_shared_clients()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Tests for the Overshoot inference worker, run against mock HTTP transports:
+    pytest scripts/test_inference_worker.py
+"""
+
+import sys
+import os
+import copy
+import json
+import asyncio
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+# Add parent directory to path
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from overshoot import inference_worker
+from overshoot.inference_worker import DifficultyLevel, InferenceRequest, OvershootInferenceWorker
+
+CONFIG_PATH = os.path.join(ROOT_DIR, "overshoot", "scaling_config.yaml")
+
+
+@pytest.fixture
+def worker(monkeypatch):
+    """Worker with a batch size of 2 so requests span several sub-batches"""
+    monkeypatch.setenv("OVERSHOOT_API_KEY", "test-key")
+    worker = OvershootInferenceWorker(CONFIG_PATH)
+    # The parsed config is shared between workers, so change a copy
+    worker.config = copy.deepcopy(worker.config)
+    worker.config["inference"]["batching"]["batch_size"] = 2
+    return worker
+
+
+def _batch_handler(request):
+    """Echo prompts; fail batches containing 'fail' and single requests containing 'bad'"""
+    body = json.loads(request.content)
+    if request.url.path == "/v1/inference/batch":
+        if any("fail" in item["prompt"] for item in body["requests"]):
+            return httpx.Response(500)
+        return httpx.Response(200, json={
+            "results": [{"text": f"batch:{item['prompt']}"} for item in body["requests"]]
+        })
+    if "bad" in body["prompt"]:
+        return httpx.Response(400)
+    return httpx.Response(200, json={"text": f"single:{body['prompt']}"})
+
+
+def test_batch_infer_keeps_order_with_fallbacks(worker, monkeypatch):
+    """Sub-batch results and fallback results come back in group and batch order"""
+    async def no_backoff(delay):
+        pass
+
+    monkeypatch.setattr(inference_worker.asyncio, "sleep", no_backoff)
+
+    easy, hard = DifficultyLevel.EASY, DifficultyLevel.HARD
+    requests = [
+        InferenceRequest(prompt="a", difficulty=easy),
+        InferenceRequest(prompt="fail", difficulty=hard),
+        InferenceRequest(prompt="c", difficulty=easy),
+        InferenceRequest(prompt="bad", difficulty=hard),
+        InferenceRequest(prompt="e", difficulty=easy),
+        InferenceRequest(prompt="h", difficulty=hard),
+    ]
+
+    async def run():
+        worker.client = httpx.AsyncClient(
+            base_url="http://overshoot.test",
+            transport=httpx.MockTransport(_batch_handler)
+        )
+        try:
+            return await worker.batch_infer(requests)
+        finally:
+            await worker.close()
+
+    responses = asyncio.run(run())
+
+    # Easy group: [a, c], [e]; hard group: [fail, bad] (falls back), [h]
+    assert [response.text for response in responses[:4]] == [
+        "batch:a", "batch:c", "batch:e", "single:fail"
+    ]
+    assert responses[4].text.startswith("Error: ")
+    assert responses[4].cluster_id == "error"
+    assert responses[5].text == "batch:h"
+    assert [response.difficulty_used for response in responses] == [easy] * 3 + [hard] * 3
+
+
+def test_shared_clients_of_closed_loops_are_dropped(worker, monkeypatch):
+    """A new event loop drops the shared clients left behind by closed loops"""
+    monkeypatch.setattr(inference_worker, "_SHARED_CLIENTS", {})
+
+    async def get_client():
+        return asyncio.get_running_loop(), worker.client
+
+    first_loop, first_client = asyncio.run(get_client())
+    second_loop, second_client = asyncio.run(get_client())
+
+    assert second_client is not first_client
+    assert first_loop not in inference_worker._SHARED_CLIENTS
+    assert list(inference_worker._SHARED_CLIENTS) == [second_loop]